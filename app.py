@@ -1,128 +1,223 @@
 import streamlit as st
-import requests
-import time
+import asyncio
 import os
+import hashlib
+
+from sora_client import SoraClient, AsyncSoraClient, Backoff, calculate_cost, SIZES
 
 # --------------------------
-# SoraClient Class (Backend Logic)
+# Styles
 # --------------------------
-class SoraClient:
-    API_BASE = "https://api.openai.com/v1"
-
-    def __init__(self, api_key):
-        self.api_key = api_key
-        self.headers = {
-            "Authorization": f"Bearer {api_key}",
-            "Content-Type": "application/json"
-        }
-
-    def create_job(self, prompt, model, seconds, size):
-        url = f"{self.API_BASE}/videos"
-        payload = {
-            "model": model,
-            "prompt": prompt,
-            "seconds": str(seconds),
-            "size": size
-        }
-        
-        try:
-            response = requests.post(url, json=payload, headers=self.headers)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.HTTPError as e:
-            if e.response.status_code == 401:
-                return {"error": "Invalid API Key. Please check your credentials."}
-            return {"error": e.response.text or str(e)}
-        except requests.exceptions.RequestException as e:
-            return {"error": f"Connection error: {str(e)}"}
-
-    def get_status(self, video_id):
-        url = f"{self.API_BASE}/videos/{video_id}"
-        try:
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            return {"status": "error", "error": str(e)}
-
-    def download_video(self, video_id):
-        url = f"{self.API_BASE}/videos/{video_id}/content"
-        try:
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
-            return response.content
-        except Exception as e:
-             raise RuntimeError(f"Download failed: {e}")
-
-    def refine_prompt_text(self, text):
-        """
-        Attempts to use chatgpt-5-nano. Falls back to gpt-4o-mini if unavailable.
-        """
-        url = f"{self.API_BASE}/chat/completions"
-        try:
-            return self._call_chat_api(url, "chatgpt-5-nano", text)
-        except Exception:
-            try:
-                return self._call_chat_api(url, "gpt-4o-mini", text)
-            except Exception as e2:
-                return f"Error refining prompt: {e2}"
-
-    def _call_chat_api(self, url, model_name, text):
-        payload = {
-            "model": model_name, 
-            "messages": [
-                {
-                    "role": "system", 
-                    "content": "You are an expert prompt engineer for Sora 2 video generation. "
-                               "Rewrite the user's prompt to be highly descriptive, focusing on lighting, "
-                               "camera angles, textures, and physics. Keep it concise (under 150 words) but vivid."
-                },
-                {"role": "user", "content": text}
-            ],
-            "temperature": 0.7
-        }
-        response = requests.post(url, json=payload, headers=self.headers)
-        response.raise_for_status()
-        return response.json()['choices'][0]['message']['content']
+# Must be emitted on every full rerun: Streamlit drops elements a run doesn't
+# redraw, so a one-shot injection would lose the styling after the first click.
+CSS_BLOCK = """
+    <style>
+    .stButton button { border-radius: 8px; font-weight: bold; }
+    .cost-box { 
+        background-color: #f0f2f6; 
+        padding: 10px; 
+        border-radius: 5px; 
+        border-left: 5px solid #00c853;
+        margin-bottom: 20px;
+    }
+    [data-testid="stStatusWidget"] { visibility: hidden; }
+    </style>
+"""
 
 # --------------------------
-# Helper: Cost Calculator
+# Helper: Caching Across Reruns
 # --------------------------
-def calculate_cost(model, seconds, size):
-    duration = int(seconds)
-    price_per_sec = 0.0
+def key_hash(api_key):
+    # Cache keys only ever see a digest, never the raw secret
+    return hashlib.sha256(api_key.encode()).hexdigest()[:16]
+
+@st.cache_resource(show_spinner=False)
+def get_client(api_key):
+    # One client (and connection pool) per key for the app's lifetime
+    return SoraClient(api_key)
+
+@st.cache_data(show_spinner=False, max_entries=64, ttl=3600)
+def cached_refine(api_key_hash, text, _client):
+    return _client.refine_prompt_text(text)
+
+@st.cache_data(show_spinner=False, max_entries=256)
+def cost_html(model, size, seconds, batch_size):
+    single_cost = calculate_cost(model, seconds, size)
+    total_batch_cost = single_cost * batch_size
+    return f"""
+    <div class="cost-box">
+        <b>💰 Estimated Cost:</b> ${total_batch_cost:.2f} <br>
+        <small>(${single_cost:.2f} per video x {batch_size} copies)</small>
+    </div>
+    """
+
+def cache_video(video_id, vid_bytes):
+    # Only the latest batch is kept (at most 5 videos), see main()
+    st.session_state.setdefault("last_batch_videos", {})[video_id] = vid_bytes
+
+def render_video(video_id, vid_bytes):
+    st.success(f"✅ Video {video_id[-6:]} Ready!")
+    st.video(vid_bytes)
+    st.download_button(
+        f"💾 Download.mp4", 
+        vid_bytes, 
+        file_name=f"{video_id}.mp4",
+        mime="video/mp4"
+    )
+
+# --------------------------
+# Batch Polling (asyncio)
+# --------------------------
+DL_PREFIX = "⬇️ Downloading: "
+
+async def download_and_render(client, job, download_slots):
+    with job["ui_placeholder"].container():
+        st.success(f"✅ Video {job['id'][-6:]} Ready!")
+        dl_bar = st.progress(0, text="⬇️ Downloading...")
+
+    def update_dl_bar(percent):
+        dl_bar.progress(percent, text=DL_PREFIX + f"{int(percent*100)}%")
+
+    try:
+        async with download_slots:
+            vid_bytes = await client.download_video(job["id"], progress_callback=update_dl_bar)
+    except Exception as e:
+        with job["ui_placeholder"].container():
+            st.error(f"Download failed: {e}")
+        return
+
+    cache_video(job["id"], vid_bytes)
+    with job["ui_placeholder"].container():
+        render_video(job["id"], vid_bytes)
+
+def apply_status(client, job, data, active_jobs, download_slots):
+    if job not in active_jobs:
+        # Late event for a job that already finished
+        return
+
+    new_status = data.get("status", "unknown")
+    progress = data.get("progress", 0)
+    job["backoff"].update(new_status)
     
-    if model == "sora-2":
-        price_per_sec = 0.10
-    elif model == "sora-2-pro":
-        width, height = map(int, size.split("x"))
-        is_hd = (width * height) > (1280 * 720)
-        price_per_sec = 0.50 if is_hd else 0.30
+    # Update the existing widgets in place instead of rebuilding them
+    job["label"].markdown(f"**Job {job['id'][-6:]}**: `{new_status}`")
+    current_prog = int(progress) if progress else 0
+    if new_status == "queued":
+        job["progress_bar"].progress(5)
+    elif new_status in ["processing", "in_progress"]:
+        job["progress_bar"].progress(max(current_prog, 10))
+    
+    if new_status in ["succeeded", "completed"]:
+        active_jobs.remove(job)
+        job["progress_bar"].progress(100)
+        # Download in the background while the rest keep polling
+        job["dl_task"] = asyncio.create_task(download_and_render(client, job, download_slots))
+                
+    elif new_status in ["failed", "rejected", "error"]:
+        active_jobs.remove(job)
+        job["ui_placeholder"].error(f"❌ Job {job['id'][-6:]} Failed")
+
+async def watch_events(client, job, updates):
+    """Forwards pushed status events for one job; marks it for polling when the stream ends."""
+    job["streaming"] = True
+    try:
+        async for data in client.stream_status(job["id"]):
+            await updates.put((job, data))
+    except Exception:
+        pass
+    finally:
+        job["streaming"] = False
+
+async def poll_all(api_key, jobs):
+    active_jobs = jobs[:]
+    # Cap parallel downloads so a big batch doesn't saturate the link
+    download_slots = asyncio.Semaphore(min(len(jobs), 4))
+    loop = asyncio.get_running_loop()
+
+    for job in jobs:
+        job["backoff"] = Backoff()
 
-    return price_per_sec * duration
+    async with AsyncSoraClient(api_key) as client:
+        updates = asyncio.Queue()
+        watchers = [asyncio.create_task(watch_events(client, job, updates)) for job in jobs]
+        next_poll = loop.time() + min(job["backoff"].delay for job in active_jobs)
+
+        while active_jobs:
+            try:
+                job, data = await asyncio.wait_for(updates.get(), max(next_poll - loop.time(), 0))
+                apply_status(client, job, data, active_jobs, download_slots)
+                continue
+            except asyncio.TimeoutError:
+                pass
+
+            # Jobs without a live event stream fall back to adaptive polling
+            polled = [job for job in active_jobs if not job.get("streaming")]
+            if polled:
+                statuses = await client.get_statuses([job["id"] for job in polled])
+                for job in polled:
+                    apply_status(client, job, statuses[job["id"]], active_jobs, download_slots)
+            if active_jobs:
+                next_poll = loop.time() + min(job["backoff"].delay for job in active_jobs)
+
+        for watcher in watchers:
+            watcher.cancel()
+        await asyncio.gather(*(job["dl_task"] for job in jobs if "dl_task" in job))
 
 # --------------------------
 # Streamlit App
 # --------------------------
+@st.fragment
+def prompt_editor(api_key):
+    """
+    Draft/refine/final prompt boxes. Runs as a fragment so typing and refining
+    only re-render this block, not the sidebar, CSS and cost box.
+    """
+    st.subheader("1️⃣ Concept (Draft)")
+    raw_concept = st.text_area(
+        "Draft your idea here...", 
+        height=100, 
+        placeholder="A cat eating pizza on the moon",
+        key="raw_input" 
+    )
+
+    if st.button("✨ AI Refine Prompt (via ChatGPT-5-Nano)"):
+        if not api_key:
+            st.error("Please enter an API Key first.")
+        elif not raw_concept:
+            st.warning("Please type a concept above first.")
+        else:
+            refined = None
+            with st.spinner("Refining your idea..."):
+                try:
+                    refined = cached_refine(key_hash(api_key), raw_concept, get_client(api_key))
+                except RuntimeError as e:
+                    st.error(str(e))
+            if refined:
+                st.session_state.refined_prompt_text = refined
+                st.session_state.final_prompt_widget = refined 
+                st.rerun(scope="fragment")
+
+    st.subheader("2️⃣ Final Prompt (Ready to Generate)")
+    final_prompt = st.text_area(
+        "Review and edit before generating:",
+        value=st.session_state.refined_prompt_text,
+        height=150,
+        key="final_prompt_widget"
+    )
+
+    st.write("") 
+    if final_prompt:
+        st.info("✅ **Ready:** Using **Refined Prompt** (Box 2)")
+    elif raw_concept:
+        st.info("ℹ️ **Ready:** Using **Draft Concept** (Box 1)")
+
 def main():
     st.set_page_config(page_title="Sora 2 Studio", page_icon="🎥", layout="wide")
 
     if "refined_prompt_text" not in st.session_state:
         st.session_state.refined_prompt_text = ""
 
-    st.markdown("""
-        <style>
-        .stButton button { border-radius: 8px; font-weight: bold; }
-        .cost-box { 
-            background-color: #f0f2f6; 
-            padding: 10px; 
-            border-radius: 5px; 
-            border-left: 5px solid #00c853;
-            margin-bottom: 20px;
-        }
-        [data-testid="stStatusWidget"] { visibility: hidden; }
-        </style>
-    """, unsafe_allow_html=True)
+    st.markdown(CSS_BLOCK, unsafe_allow_html=True)
 
     st.title("🎥 Sora 2 Studio Pro")
 
@@ -152,7 +247,7 @@ def main():
             default_size_idx = 0 # 1280x720
         else:
             # Pro model limits (unlocks 1080p and 20s)
-            valid_sizes = ["1920x1080", "1080x1920", "1280x720", "720x1280", "480x854", "854x480"]
+            valid_sizes = SIZES
             valid_seconds = ["4", "8", "12", "16", "20"]
             default_size_idx = 2 # 1280x720
             
@@ -164,52 +259,12 @@ def main():
         batch_size = st.slider("Number of Videos", 1, 5, 1)
 
     # --- Main Input Area ---
-    st.subheader("1️⃣ Concept (Draft)")
-    raw_concept = st.text_area(
-        "Draft your idea here...", 
-        height=100, 
-        placeholder="A cat eating pizza on the moon",
-        key="raw_input" 
-    )
-
-    if st.button("✨ AI Refine Prompt (via ChatGPT-5-Nano)"):
-        if not api_key:
-            st.error("Please enter an API Key first.")
-        elif not raw_concept:
-            st.warning("Please type a concept above first.")
-        else:
-            with st.spinner("Refining your idea..."):
-                client = SoraClient(api_key)
-                refined = client.refine_prompt_text(raw_concept)
-                st.session_state.refined_prompt_text = refined
-                st.session_state.final_prompt_widget = refined 
-                st.rerun()
-
-    st.subheader("2️⃣ Final Prompt (Ready to Generate)")
-    final_prompt = st.text_area(
-        "Review and edit before generating:",
-        value=st.session_state.refined_prompt_text,
-        height=150,
-        key="final_prompt_widget"
-    )
-    
+    prompt_editor(api_key)
+    raw_concept = st.session_state.raw_input
+    final_prompt = st.session_state.final_prompt_widget
     active_prompt = final_prompt if final_prompt else raw_concept
 
-    st.write("") 
-    single_cost = calculate_cost(model, seconds, size)
-    total_batch_cost = single_cost * batch_size
-    
-    if final_prompt:
-        st.info("✅ **Ready:** Using **Refined Prompt** (Box 2)")
-    elif raw_concept:
-        st.info("ℹ️ **Ready:** Using **Draft Concept** (Box 1)")
-    
-    st.markdown(f"""
-    <div class="cost-box">
-        <b>💰 Estimated Cost:</b> ${total_batch_cost:.2f} <br>
-        <small>(${single_cost:.2f} per video x {batch_size} copies)</small>
-    </div>
-    """, unsafe_allow_html=True)
+    st.markdown(cost_html(model, size, seconds, batch_size), unsafe_allow_html=True)
 
     generate_btn = st.button(f"🚀 Generate {batch_size} Video{'s' if batch_size > 1 else ''}", type="primary", use_container_width=True)
 
@@ -218,6 +273,12 @@ def main():
     st.subheader("📺 Output Queue")
     output_container = st.container()
 
+    if not generate_btn:
+        # Reruns (e.g. the download button) redraw finished videos from memory
+        for video_id, vid_bytes in st.session_state.get("last_batch_videos", {}).items():
+            with output_container:
+                render_video(video_id, vid_bytes)
+
     if generate_btn:
         if not api_key:
             st.error("Missing API Key")
@@ -226,22 +287,26 @@ def main():
             st.error("Please enter a prompt.")
             return
 
-        client = SoraClient(api_key)
+        client = get_client(api_key)
         jobs = []
+        # A new batch replaces the previous one's videos in memory
+        st.session_state.last_batch_videos = {}
 
         with st.status(f"🚀 Starting {batch_size} job(s)...", expanded=True) as status:
-            for i in range(batch_size):
-                status.write(f"Submitting job {i+1}/{batch_size}...")
-                job_data = client.create_job(active_prompt, model, seconds, size)
-                
+            status.write(f"Submitting {batch_size} job(s)...")
+            results = client.create_jobs(active_prompt, model, seconds, size, batch_size)
+
+            for i, job_data in enumerate(results):
                 if job_data.get("error"):
                     st.error(f"Failed to start job {i+1}: {job_data['error']}")
                     continue
                     
+                job_box = output_container.container()
                 jobs.append({
                     "id": job_data["id"], 
-                    "ui_placeholder": output_container.empty(),
-                    "progress_bar": None
+                    "label": job_box.empty(),
+                    "progress_bar": job_box.progress(0),
+                    "ui_placeholder": job_box.empty()
                 })
             
             if not jobs:
@@ -250,47 +315,7 @@ def main():
             
             status.update(label="⚡ Processing Batch...", state="running")
 
-        active_jobs = jobs[:]
-        
-        while active_jobs:
-            time.sleep(4)
-            for job in reversed(active_jobs):
-                data = client.get_status(job["id"])
-                new_status = data.get("status", "unknown")
-                progress = data.get("progress", 0)
-                
-                with job["ui_placeholder"].container():
-                    st.write(f"**Job {job['id'][-6:]}**: `{new_status}`")
-                    if not job["progress_bar"]:
-                        job["progress_bar"] = st.progress(0)
-                    
-                    current_prog = int(progress) if progress else 0
-                    if new_status == "queued":
-                        job["progress_bar"].progress(5)
-                    elif new_status in ["processing", "in_progress"]:
-                        job["progress_bar"].progress(max(current_prog, 10))
-                
-                if new_status in ["succeeded", "completed"]:
-                    active_jobs.remove(job)
-                    with job["ui_placeholder"].container():
-                        st.success(f"✅ Video {job['id'][-6:]} Ready!")
-                        job["progress_bar"].progress(100)
-                        try:
-                            vid_bytes = client.download_video(job["id"])
-                            st.video(vid_bytes)
-                            st.download_button(
-                                f"💾 Download.mp4", 
-                                vid_bytes, 
-                                file_name=f"{job['id']}.mp4",
-                                mime="video/mp4"
-                            )
-                        except Exception as e:
-                            st.error(f"Download failed: {e}")
-                            
-                elif new_status in ["failed", "rejected", "error"]:
-                    active_jobs.remove(job)
-                    with job["ui_placeholder"].container():
-                        st.error(f"❌ Job {job['id'][-6:]} Failed")
+        asyncio.run(poll_all(api_key, jobs))
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,433 @@
+import requests
+import aiohttp
+import asyncio
+import random
+import time
+import json
+import atexit
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# --------------------------
+# JSON (orjson when installed)
+# --------------------------
+if orjson is not None:
+    json_dumps = orjson.dumps
+    json_loads = orjson.loads
+else:
+    def json_dumps(obj):
+        return json.dumps(obj).encode()
+
+    json_loads = json.loads
+
+# --------------------------
+# Retry Policy (Transient API Errors)
+# --------------------------
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+# POST /videos starts a paid render, so it is only resent when the server
+# says it never took the request
+POST_RETRY_STATUSES = (429, 503)
+
+class JitterRetry(Retry):
+    """
+    urllib3 Retry whose exponential backoff gets up to 0.5s of random jitter.
+    GETs retry on any transient status or read error; POSTs (not idempotent)
+    only on connect errors and 429/503 responses carrying Retry-After.
+    """
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if method == "POST":
+            return bool(
+                self.total
+                and has_retry_after
+                and status_code in POST_RETRY_STATUSES
+            )
+        return super().is_retry(method, status_code, has_retry_after)
+
+    def get_backoff_time(self):
+        backoff = super().get_backoff_time()
+        return backoff + random.uniform(0, 0.5) if backoff else backoff
+
+# --------------------------
+# SoraClient Class (Backend Logic)
+# --------------------------
+class SoraClient:
+    API_BASE = "https://api.openai.com/v1"
+
+    def __init__(self, api_key):
+        self.api_key = api_key
+        self.headers = {
+            "Authorization": f"Bearer {api_key}",
+            "Content-Type": "application/json"
+        }
+        # One pooled session so submissions and refine calls reuse keep-alive connections
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        retry = JitterRetry(
+            total=5,
+            backoff_factor=0.5,
+            status_forcelist=RETRY_STATUSES,
+            # POST stays out so read errors never resend it; see JitterRetry.is_retry
+            allowed_methods=frozenset(["GET"]),
+            respect_retry_after_header=True,
+            # Hand the last error response back so raise_for_status reports it
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(max_retries=retry, pool_connections=10, pool_maxsize=20)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # Clients may be long-lived (cached across reruns); release sockets on exit
+        atexit.register(self.close)
+        # Flipped off once a 400/422 names the "n" parameter as unsupported
+        self.batch_create = True
+
+    def close(self):
+        self.session.close()
+
+    def create_job(self, prompt, model, seconds, size, n=None):
+        url = f"{self.API_BASE}/videos"
+        payload = {
+            "model": model,
+            "prompt": prompt,
+            "seconds": str(seconds),
+            "size": size
+        }
+        if n:
+            payload["n"] = n
+        
+        try:
+            response = self.session.post(url, data=json_dumps(payload))
+            response.raise_for_status()
+            return json_loads(response.content)
+        except requests.exceptions.HTTPError as e:
+            status_code = e.response.status_code
+            if status_code == 401:
+                return {"error": "Invalid API Key. Please check your credentials.", "status_code": status_code}
+            return {
+                "error": e.response.text or str(e),
+                "status_code": status_code,
+                "param": self._error_param(e.response)
+            }
+        except requests.exceptions.RequestException as e:
+            return {"error": f"Connection error: {str(e)}"}
+        except ValueError as e:
+            # orjson/json decode errors aren't RequestExceptions like response.json()'s
+            return {"error": f"Unexpected response from API: {str(e)}"}
+
+    @staticmethod
+    def _error_param(response):
+        # OpenAI error bodies look like {"error": {"message": ..., "param": "n"}}
+        try:
+            error = json_loads(response.content).get("error")
+            return error.get("param") if isinstance(error, dict) else None
+        except (ValueError, AttributeError):
+            return None
+
+    @staticmethod
+    def _rejects_n(data):
+        if data.get("status_code") not in (400, 422):
+            return False
+        message = data.get("error", "")
+        return (
+            data.get("param") == "n"
+            or "Unknown parameter: 'n'" in message
+            or "Unrecognized request argument supplied: n" in message
+        )
+
+    def create_jobs(self, prompt, model, seconds, size, n):
+        """
+        Returns n job dicts (or {"error": ...} entries). Asks for all n in a
+        single request first; any the API didn't create that way are submitted
+        concurrently, one request each.
+        """
+        jobs = []
+        if n > 1 and self.batch_create:
+            data = self.create_job(prompt, model, seconds, size, n=n)
+            if isinstance(data, list):
+                jobs = data
+            elif data.get("error"):
+                if not self._rejects_n(data):
+                    # Moderation, auth failures, outages etc. would hit every
+                    # per-job request too
+                    return [data]
+                self.batch_create = False
+            else:
+                jobs = data.get("data") or [data]
+            jobs = jobs[:n]
+
+        remaining = n - len(jobs)
+        if remaining > 0:
+            with ThreadPoolExecutor(max_workers=remaining) as ex:
+                futures = [
+                    ex.submit(self.create_job, prompt, model, seconds, size)
+                    for _ in range(remaining)
+                ]
+                jobs.extend(f.result() for f in futures)
+        return jobs
+
+    def refine_prompt_text(self, text):
+        """
+        Attempts to use chatgpt-5-nano. Falls back to gpt-4o-mini if unavailable.
+        """
+        url = f"{self.API_BASE}/chat/completions"
+        try:
+            return self._call_chat_api(url, "chatgpt-5-nano", text)
+        except Exception:
+            try:
+                return self._call_chat_api(url, "gpt-4o-mini", text)
+            except Exception as e2:
+                raise RuntimeError(f"Error refining prompt: {e2}")
+
+    def _call_chat_api(self, url, model_name, text):
+        payload = {
+            "model": model_name, 
+            "messages": [
+                {
+                    "role": "system", 
+                    "content": "You are an expert prompt engineer for Sora 2 video generation. "
+                               "Rewrite the user's prompt to be highly descriptive, focusing on lighting, "
+                               "camera angles, textures, and physics. Keep it concise (under 150 words) but vivid."
+                },
+                {"role": "user", "content": text}
+            ],
+            "temperature": 0.7
+        }
+        response = self.session.post(url, data=json_dumps(payload))
+        response.raise_for_status()
+        return json_loads(response.content)['choices'][0]['message']['content']
+
+# --------------------------
+# AsyncSoraClient Class (Polling & Downloads)
+# --------------------------
+class AsyncSoraClient:
+    """
+    Async counterpart of SoraClient so status checks and downloads for a
+    whole batch run concurrently on one event loop.
+    """
+    API_BASE = SoraClient.API_BASE
+
+    def __init__(self, api_key):
+        self.headers = {"Authorization": f"Bearer {api_key}"}
+        self.session = None
+        # Flipped off the first time the list endpoint can't answer for our ids
+        self.bulk_status = True
+        # Flipped off the first time the events endpoint is missing
+        self.sse_supported = True
+        # video_id -> (etag, status_dict) so unchanged polls come back as 304s
+        self.etags = {}
+
+    async def __aenter__(self):
+        self.session = aiohttp.ClientSession(
+            headers=self.headers,
+            connector=aiohttp.TCPConnector(limit=20)
+        )
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.session.close()
+
+    async def get_status(self, video_id, retries=3):
+        """
+        Retries transient failures (5xx, 429, dropped connections) with jittered
+        backoff so an API blip doesn't mark an in-flight render as failed.
+        """
+        url = f"{self.API_BASE}/videos/{video_id}"
+        cached = self.etags.get(video_id)
+        headers = {"If-None-Match": cached[0]} if cached else {}
+        for attempt in range(retries + 1):
+            try:
+                async with self.session.get(url, headers=headers) as response:
+                    if response.status == 304 and cached:
+                        return cached[1]
+                    if response.status in RETRY_STATUSES and attempt < retries:
+                        await asyncio.sleep(0.5 * 2 ** attempt + random.uniform(0, 0.5))
+                        continue
+                    response.raise_for_status()
+                    data = json_loads(await response.read())
+                    if response.headers.get("ETag"):
+                        self.etags[video_id] = (response.headers["ETag"], data)
+                    return data
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                if attempt < retries:
+                    await asyncio.sleep(0.5 * 2 ** attempt + random.uniform(0, 0.5))
+                    continue
+                return {"status": "error", "error": str(e)}
+            except Exception as e:
+                return {"status": "error", "error": str(e)}
+
+    async def stream_status(self, video_id):
+        """
+        Yields status dicts pushed over server-sent events. Ends immediately if
+        the API has no events endpoint, so callers fall back to polling.
+        """
+        if not self.sse_supported:
+            return
+        url = f"{self.API_BASE}/videos/{video_id}/events"
+        async with self.session.get(
+            url,
+            headers={"Accept": "text/event-stream"},
+            timeout=aiohttp.ClientTimeout(total=None, sock_read=60)
+        ) as response:
+            if response.status in (404, 406):
+                self.sse_supported = False
+                return
+            response.raise_for_status()
+            async for raw_line in response.content:
+                line = raw_line.decode().strip()
+                if not line.startswith("data:"):
+                    continue
+                payload = line[len("data:"):].strip()
+                if payload == "[DONE]":
+                    return
+                yield json_loads(payload)
+
+    async def get_statuses(self, video_ids):
+        """
+        Returns {video_id: status_dict}. Tries one bulk list request first and
+        falls back to concurrent per-id requests for anything it didn't cover.
+        """
+        statuses = {}
+        if self.bulk_status:
+            statuses = await self._list_statuses(video_ids)
+            if not statuses:
+                self.bulk_status = False
+
+        missing = [video_id for video_id in video_ids if video_id not in statuses]
+        results = await asyncio.gather(*(self.get_status(video_id) for video_id in missing))
+        statuses.update(zip(missing, results))
+        return statuses
+
+    async def _list_statuses(self, video_ids):
+        url = f"{self.API_BASE}/videos"
+        try:
+            async with self.session.get(url, params={"ids": ",".join(video_ids)}) as response:
+                response.raise_for_status()
+                data = json_loads(await response.read())
+        except Exception:
+            return {}
+        videos = data.get("data") if isinstance(data, dict) else None
+        if not isinstance(videos, list):
+            return {}
+        wanted = set(video_ids)
+        return {
+            video["id"]: video for video in videos
+            if isinstance(video, dict) and video.get("id") in wanted
+        }
+
+    async def download_video(self, video_id, progress_callback=None, max_resumes=3):
+        """
+        Streams the MP4 in 1 MB chunks. If the connection drops mid-transfer,
+        resumes from the last received byte with a Range request.
+        progress_callback fires at most every 50ms and only when the whole
+        percentage changes, plus once at 100%.
+        """
+        url = f"{self.API_BASE}/videos/{video_id}/content"
+        video_content = bytearray()
+        view = None
+        received = 0
+        total = 0
+        resumes = 0
+        last_pct = -1
+        last_time = 0.0
+
+        while True:
+            # Ask for the raw bytes: aiohttp would otherwise negotiate gzip and
+            # Content-Length/Range offsets would count compressed bytes
+            headers = {"Accept-Encoding": "identity"}
+            if received:
+                headers["Range"] = f"bytes={received}-"
+            try:
+                async with self.session.get(url, headers=headers) as response:
+                    response.raise_for_status()
+                    encoded = bool(response.headers.get("Content-Encoding"))
+                    if response.status == 206:
+                        # Content-Range: bytes start-end/size carries the full size
+                        full_size = response.headers.get("Content-Range", "").rpartition("/")[2]
+                        if not total and full_size.isdigit():
+                            total = int(full_size)
+                    else:
+                        if received:
+                            # Server ignored the Range header, start over
+                            received = 0
+                            if view is None:
+                                video_content.clear()
+                        if not total and not encoded:
+                            total = int(response.headers.get("content-length", 0))
+                        if total and view is None:
+                            # Known size: allocate once and write chunks in place
+                            video_content = bytearray(total)
+                            view = memoryview(video_content)
+
+                    async for chunk in response.content.iter_chunked(1 << 20):
+                        if view is not None and received + len(chunk) > len(view):
+                            # More bytes than announced: keep what we have and grow instead
+                            video_content = bytearray(view[:received])
+                            view.release()
+                            view = None
+                        if view is not None:
+                            view[received:received + len(chunk)] = chunk
+                        else:
+                            video_content.extend(chunk)
+                        received += len(chunk)
+                        if progress_callback and total:
+                            percent = min(received / total, 1.0)
+                            pct = int(percent * 100)
+                            now = time.monotonic()
+                            if pct == 100 or (pct > last_pct and now - last_time > 0.05):
+                                progress_callback(percent)
+                                last_pct = pct
+                                last_time = now
+                return memoryview(video_content)[:received].tobytes()
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError, asyncio.TimeoutError) as e:
+                resumes += 1
+                if resumes > max_resumes:
+                    raise RuntimeError(f"Download failed: {e}")
+            except Exception as e:
+                raise RuntimeError(f"Download failed: {e}")
+
+# --------------------------
+# Helper: Cost Calculator
+# --------------------------
+SIZES = ["1920x1080", "1080x1920", "1280x720", "720x1280", "480x854", "854x480"]
+
+def _is_hd(size):
+    width, height = map(int, size.split("x"))
+    return (width * height) > (1280 * 720)
+
+# Built once at import so the per-rerun cost lookup never parses sizes
+PRICE_PER_SEC = {("sora-2", s): 0.10 for s in SIZES}
+PRICE_PER_SEC.update({("sora-2-pro", s): 0.50 if _is_hd(s) else 0.30 for s in SIZES})
+
+def calculate_cost(model, seconds, size):
+    return PRICE_PER_SEC.get((model, size), 0.0) * int(seconds)
+
+# --------------------------
+# Helper: Poll Backoff
+# --------------------------
+class Backoff:
+    """
+    Poll delay for a single job. Grows exponentially with full jitter while
+    the job is queued and snaps back to the base interval once it is processing.
+    """
+
+    def __init__(self, base=2.0, cap=15.0):
+        self.base = base
+        self.cap = cap
+        self.attempt = 0
+        self.delay = base
+
+    def update(self, status):
+        if status == "queued":
+            self.attempt += 1
+            self.delay = random.uniform(self.base, min(self.cap, self.base * 2 ** self.attempt))
+        else:
+            self.attempt = 0
+            self.delay = self.base
+        return self.delay